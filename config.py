@@ -1,4 +1,6 @@
 # app/config.py
+from typing import Optional
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
@@ -14,4 +16,15 @@ class Settings(BaseSettings):
     # API configuration
     API_TITLE: str = "DeFi Reputation Scoring Server"
     API_DESCRIPTION: str = "A microservice to calculate wallet reputation scores using AI."
-    API_VERSION: str = "1.0.0"
\ No newline at end of file
+    API_VERSION: str = "1.0.0"
+
+    # Scoring pool configuration; SCORING_WORKERS defaults to the CPU count and
+    # values <= 1 score batches in-process
+    SCORING_WORKERS: Optional[int] = None
+    SCORING_CHUNK_SIZE: int = 32
+
+    # Validate outgoing success messages against WalletScoreSuccess (development only)
+    VALIDATE_OUTPUT_SCHEMA: bool = False
+
+    # Seconds to wait on shutdown for the in-flight batch before cancelling it
+    SHUTDOWN_TIMEOUT_S: float = 30.0
\ No newline at end of file
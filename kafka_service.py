@@ -1,9 +1,8 @@
 # app/services/kafka_service.py
 
-import json
-import asyncio
 import os
-from kafka import KafkaConsumer, KafkaProducer
+import orjson
+from aiokafka import AIOKafkaConsumer, AIOKafkaProducer
 
 # --- Singleton Pattern for Kafka Service ---
 class KafkaService:
@@ -26,46 +25,77 @@ class KafkaService:
         self.INPUT_TOPIC = os.getenv("KAFKA_INPUT_TOPIC", "wallet-transactions")
         self.SUCCESS_TOPIC = os.getenv("KAFKA_SUCCESS_TOPIC", "wallet-scores-success")
         self.FAILURE_TOPIC = os.getenv("KAFKA_FAILURE_TOPIC", "wallet-scores-failure")
+        self.POLL_TIMEOUT_MS = int(os.getenv("KAFKA_POLL_TIMEOUT_MS", "500"))
+        self.POLL_MAX_RECORDS = int(os.getenv("KAFKA_POLL_MAX_RECORDS", "256"))
+        self.PRODUCER_LINGER_MS = int(os.getenv("KAFKA_PRODUCER_LINGER_MS", "20"))
+        self.PRODUCER_BATCH_SIZE = int(os.getenv("KAFKA_PRODUCER_BATCH_SIZE", str(64 * 1024)))
+        self.PRODUCER_COMPRESSION = os.getenv("KAFKA_PRODUCER_COMPRESSION", "lz4")
         
         self._consumer_task = None
 
-    def get_consumer(self):
+    async def get_consumer(self):
         if not self._consumer:
-            self._consumer = KafkaConsumer(
+            consumer = AIOKafkaConsumer(
                 self.INPUT_TOPIC,
                 bootstrap_servers=self.KAFKA_BROKER,
                 auto_offset_reset='earliest',
                 enable_auto_commit=True,
-                value_deserializer=lambda x: json.loads(x.decode('utf-8')),
+                # Values stay raw bytes; they are decoded by the scoring workers
                 group_id="reputation-scorer-group"
             )
+            try:
+                await consumer.start()
+            except Exception:
+                # Release the half-started client so reconnect retries don't leak it
+                await consumer.stop()
+                raise
+            self._consumer = consumer
         return self._consumer
 
-    def get_producer(self):
+    async def get_producer(self):
         if not self._producer:
-            self._producer = KafkaProducer(
+            producer = AIOKafkaProducer(
                 bootstrap_servers=self.KAFKA_BROKER,
-                value_serializer=lambda x: json.dumps(x).encode('utf-8')
+                value_serializer=orjson.dumps,
+                # Let sends accumulate into compressed batches; results are
+                # flushed once per poll batch by the processor
+                linger_ms=self.PRODUCER_LINGER_MS,
+                max_batch_size=self.PRODUCER_BATCH_SIZE,
+                compression_type=self.PRODUCER_COMPRESSION,
+                acks=1
             )
+            try:
+                await producer.start()
+            except Exception:
+                await producer.stop()
+                raise
+            self._producer = producer
         return self._producer
     
     async def run_consumer(self):
         """
         Starts the Kafka consumer loop.
         """
-        consumer = self.get_consumer()
-        while True:
-            for msg in consumer:
-                # This will be handled by the main application logic
-                yield msg
-            await asyncio.sleep(1) # Sleep to prevent busy-looping
+        consumer = await self.get_consumer()
+        async for msg in consumer:
+            # This will be handled by the main application logic
+            yield msg
             
     async def stop_consumer(self):
         """
         Stops the Kafka consumer gracefully.
         """
         if self._consumer:
-            self._consumer.close()
+            await self._consumer.stop()
+            self._consumer = None
+
+    async def stop_producer(self):
+        """
+        Flushes pending messages and stops the Kafka producer gracefully.
+        """
+        if self._producer:
+            await self._producer.stop()
+            self._producer = None
             
 def get_kafka_service():
     """Dependency injection function for FastAPI."""
@@ -3,17 +3,20 @@ import asyncio
 import json
 import os
 import time
-from datetime import datetime
-from typing import Dict, Any, List
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, List, Tuple
 
 from fastapi import FastAPI, BackgroundTasks, HTTPException
 from pydantic import ValidationError
+import orjson
 import structlog
 
 # Assuming these are the files with the models and services
 from .ai_model import AIModel # Your AI model logic
 from .services.kafka_service import KafkaService, get_kafka_service # Your Kafka consumer/producer
-from .models import WalletTransactionMessage, WalletScoreSuccess, WalletScoreFailure # Pydantic models for validation
+from .models import WalletMessageEnvelope, WalletScoreSuccess, WalletScoreFailure # Pydantic models for validation
 from .config import Settings # New configuration model
 
 # --- Logging Setup ---
@@ -37,7 +40,7 @@ app = FastAPI(
 )
 ai_model = AIModel()
 
-# Global variables for statistics
+# Global variables for statistics, updated once per processed batch
 stats = {
     "processed_count": 0,
     "success_count": 0,
@@ -48,91 +51,316 @@ stats = {
 # --- Kafka Setup ---
 kafka_service = get_kafka_service()
 
+# Single-process pools for CPU-bound decoding, validation and scoring, one per
+# scoring worker, created on startup. Records are routed to a worker by their
+# Kafka key so a wallet's retries hit the same process's score memo. Empty when
+# SCORING_WORKERS <= 1, in which case batches are scored in-process.
+scoring_pools = []
+
+# Background processor task and the signal asking it to stop between batches,
+# both created on startup inside the server's event loop
+processor_task = None
+stop_requested = None
+
+def start_scoring_pools():
+    """
+    Creates the scoring worker pools, SCORING_WORKERS of them (the CPU count by default).
+    """
+    global scoring_pools
+    workers = settings.SCORING_WORKERS or os.cpu_count() or 1
+    scoring_pools = [ProcessPoolExecutor(max_workers=1) for _ in range(workers)] if workers > 1 else []
+
+def reset_scoring_pool(worker: int):
+    """
+    Replaces one worker's scoring pool, e.g. after its process died.
+    """
+    scoring_pools[worker].shutdown(wait=False, cancel_futures=True)
+    scoring_pools[worker] = ProcessPoolExecutor(max_workers=1)
+
+def stop_scoring_pools():
+    """
+    Shuts down the scoring worker pools.
+    """
+    for pool in scoring_pools:
+        pool.shutdown()
+    scoring_pools.clear()
+
+def log_send_error(future: asyncio.Future):
+    """
+    Delivery callback for producer sends; only failed deliveries are logged.
+    """
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("produce_failed", error=str(future.exception()))
+
+def build_failure(wallet_address: str, error: Exception, timestamp: int) -> Dict[str, Any]:
+    """
+    Builds the failure message for a wallet that could not be scored.
+    """
+    failure_message = WalletScoreFailure(
+        wallet_address=wallet_address,
+        timestamp=timestamp,
+        error=str(error)
+    )
+    return failure_message.model_dump()
+
+def message_wallet(message_data: Any) -> str:
+    """
+    Returns the wallet address of a decoded message, or 'N/A' if it has none.
+    """
+    if isinstance(message_data, dict):
+        return message_data.get('wallet_address', 'N/A')
+    return 'N/A'
+
+def raw_message_wallet(raw: Any) -> str:
+    """
+    Returns the wallet address of a raw message value, or 'N/A' if it has none.
+    """
+    try:
+        return message_wallet(orjson.loads(raw))
+    except Exception:
+        return 'N/A'
+
+def score_messages(messages: List[bytes], now_s: int) -> List[Tuple[bool, Dict[str, Any]]]:
+    """
+    Decodes, validates and scores a chunk of raw Kafka message values.
+
+    Normally runs inside a scoring worker, so the event loop only has to ship
+    raw bytes; it uses only this process's AI model and returns picklable
+    (succeeded, payload) pairs for the event loop to publish.
+    """
+    outputs = [None] * len(messages)
+
+    # 1. Decode the incoming messages and validate their envelope using Pydantic
+    valid = []
+    for index, raw in enumerate(messages):
+        message_data = None
+        try:
+            message_data = orjson.loads(raw)
+            WalletMessageEnvelope.model_validate(message_data)
+            valid.append((index, message_data))
+        except (ValidationError, Exception) as e:
+            outputs[index] = (False, build_failure(message_wallet(message_data), e, now_s))
+
+    # 2. Process the whole chunk at once using the AI model, on the raw
+    # transaction dictionaries
+    try:
+        results = ai_model.calculate_score_batch([message_data for _, message_data in valid])
+    except Exception:
+        # A malformed transaction fails the whole chunk; fall back to scoring
+        # wallets one by one so only the offending message is rejected
+        results = None
+
+    for position, (index, message_data) in enumerate(valid):
+        wallet_address = message_data['wallet_address']
+        try:
+            if results is not None:
+                final_score, features = results[position]
+            else:
+                final_score, features = ai_model.calculate_score(wallet_address, message_data['data'])
+
+            if not features:
+                raise ValueError("No DEX data found for wallet")
+
+            # Create the success message as a plain dict; its shape is fixed and
+            # its values come from the model, so WalletScoreSuccess is only used
+            # for the optional VALIDATE_OUTPUT_SCHEMA check
+            output_message = {
+                "wallet_address": wallet_address,
+                "zscore": f"{final_score:.18f}",  # 18 decimal places for blockchain compatibility
+                "timestamp": now_s,
+                "categories": [
+                    {
+                        "category": "dexes",
+                        "score": float(final_score),
+                        "transaction_count": features.get('total_transaction_count', 0),
+                        "features": {k: v for k, v in features.items() if k != 'user_tags'}
+                    }
+                ]
+            }
+            if settings.VALIDATE_OUTPUT_SCHEMA:
+                WalletScoreSuccess.model_validate(output_message)
+            outputs[index] = (True, output_message)
+
+        except (ValidationError, Exception) as e:
+            outputs[index] = (False, build_failure(wallet_address, e, now_s))
+
+    return outputs
+
+async def score_chunk(worker: int, chunk: List[bytes], now_s: int) -> List[Tuple[bool, Dict[str, Any]]]:
+    """
+    Scores one chunk of raw messages on a scoring worker's pool.
+    """
+    # Submitting inside the coroutine lets a pool that is already broken fail
+    # this chunk's task instead of the whole gather
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(scoring_pools[worker], score_messages, chunk, now_s)
+
+def record_worker(msg: Any, workers: int) -> int:
+    """
+    Picks the scoring worker for a Kafka record from its key, or its partition if unkeyed.
+    """
+    if msg.key is not None:
+        return zlib.crc32(msg.key) % workers
+    return msg.partition % workers
+
+async def publish(producer, topic: str, payload: Dict[str, Any]) -> bool:
+    """
+    Enqueues one result for delivery; returns False if the producer rejected it.
+    """
+    try:
+        delivery = await producer.send(topic, value=payload)
+    except Exception as e:
+        # Raised before the message is enqueued (e.g. it is too large or the
+        # accumulator stayed full); the rest of the batch is still published
+        logger.error("produce_failed", wallet_address=payload["wallet_address"], error=str(e))
+        return False
+    delivery.add_done_callback(log_send_error)
+    return True
+
+async def process_batch(records: List[Any], producer):
+    """
+    Scores a batch of Kafka records on the scoring pool, publishes the results
+    and flushes the producer once.
+    """
+    # Output timestamps have second precision, so one clock read covers the batch
+    now_s = int(time.time())
+    # Counted locally and folded into the shared stats once the batch is done
+    success_count = 0
+    failure_count = 0
+
+    # Values are still raw bytes here; they are decoded by the scoring workers
+    for msg in records:
+        logger.info(
+            "Received message",
+            topic=msg.topic,
+            partition=msg.partition,
+            offset=msg.offset
+        )
+
+    workers = len(scoring_pools)
+    if not workers:
+        outputs = score_messages([msg.value for msg in records], now_s)
+    else:
+        # Wallets are independent, so chunks of the batch are scored in
+        # parallel; each worker gets the records routed to it
+        routed = [[] for _ in range(workers)]
+        for position, msg in enumerate(records):
+            routed[record_worker(msg, workers)].append(position)
+        chunk_size = settings.SCORING_CHUNK_SIZE
+        chunks = [
+            (worker, positions[start:start + chunk_size])
+            for worker, positions in enumerate(routed)
+            for start in range(0, len(positions), chunk_size)
+        ]
+        results = await asyncio.gather(*(
+            score_chunk(worker, [records[position].value for position in positions], now_s)
+            for worker, positions in chunks
+        ), return_exceptions=True)
+
+        outputs = [None] * len(records)
+        broken_workers = set()
+        for (worker, positions), result in zip(chunks, results):
+            if isinstance(result, BaseException):
+                # A chunk that could not be scored at all (worker crash, pickling
+                # error) still gets a failure message per wallet
+                logger.error("Scoring chunk failed", error=repr(result))
+                if isinstance(result, BrokenProcessPool):
+                    broken_workers.add(worker)
+                result = [
+                    (False, build_failure(raw_message_wallet(records[position].value), result, now_s))
+                    for position in positions
+                ]
+            for position, output in zip(positions, result):
+                outputs[position] = output
+        for worker in broken_workers:
+            # A broken pool rejects every later submission, so replace it
+            reset_scoring_pool(worker)
+
+    for succeeded, payload in outputs:
+        if succeeded:
+            # 3. Publish the successful result to the Kafka success topic
+            # The send is only enqueued; delivery errors surface in log_send_error
+            if await publish(producer, kafka_service.SUCCESS_TOPIC, payload):
+                logger.info("Published success", wallet_address=payload["wallet_address"])
+                success_count += 1
+            else:
+                failure_count += 1
+        else:
+            logger.error(
+                "Processing failed",
+                wallet_address=payload["wallet_address"],
+                error=payload["error"]
+            )
+            # Publish the failure result to the Kafka failure topic
+            await publish(producer, kafka_service.FAILURE_TOPIC, payload)
+            failure_count += 1
+
+    stats["processed_count"] += len(records)
+    stats["success_count"] += success_count
+    stats["failure_count"] += failure_count
+    stats["last_processed_timestamp"] = int(records[-1].timestamp / 1000)
+
+    await producer.flush()
+
 async def kafka_processor():
     """
     Background task to consume messages from Kafka, process them, and publish results.
+    Messages are polled and processed in batches of up to KAFKA_POLL_MAX_RECORDS.
     """
-    global stats
     logger.info("Starting Kafka message processor...")
-    while True:
+    while not stop_requested.is_set():
         try:
-            consumer = kafka_service.get_consumer()
-            producer = kafka_service.get_producer()
-
-            for msg in consumer:
-                logger.info(
-                    "Received message",
-                    topic=msg.topic,
-                    wallet_address=msg.value.get('wallet_address', 'N/A')
+            consumer = await kafka_service.get_consumer()
+            producer = await kafka_service.get_producer()
+
+            # Stop is only checked between batches, so a batch whose offsets
+            # were already taken is always published in full
+            while not stop_requested.is_set():
+                batch = await consumer.getmany(
+                    timeout_ms=kafka_service.POLL_TIMEOUT_MS,
+                    max_records=kafka_service.POLL_MAX_RECORDS
                 )
-                stats["processed_count"] += 1
-                stats["last_processed_timestamp"] = int(msg.timestamp / 1000)
-
-                try:
-                    # 1. Validate the incoming message using Pydantic
-                    message_data = WalletTransactionMessage.model_validate(msg.value)
-
-                    # 2. Process the data using the AI model
-                    final_score, features = ai_model.calculate_score(message_data.model_dump())
-                    
-                    # Create the success message
-                    output_message = WalletScoreSuccess(
-                        wallet_address=message_data.wallet_address,
-                        zscore=f"{final_score:.18f}",  # 18 decimal places for blockchain compatibility
-                        timestamp=int(datetime.now().timestamp()),
-                        categories=[
-                            {
-                                "category": "dexes",
-                                "score": final_score,
-                                "transaction_count": features.get('total_transaction_count', 0),
-                                "features": {k: v for k, v in features.items() if k != 'user_tags'}
-                            }
-                        ]
-                    )
-                    
-                    # 3. Publish the successful result to the Kafka success topic
-                    producer.send(kafka_service.SUCCESS_TOPIC, value=output_message.model_dump_json().encode('utf-8'))
-                    logger.info("Published success", wallet_address=message_data.wallet_address)
-                    stats["success_count"] += 1
-
-                except (ValidationError, Exception) as e:
-                    logger.error(
-                        "Processing failed",
-                        wallet_address=msg.value.get('wallet_address', 'N/A'),
-                        error=str(e)
-                    )
-                    stats["failure_count"] += 1
-                    # Create the failure message
-                    failure_message = WalletScoreFailure(
-                        wallet_address=msg.value.get('wallet_address', 'N/A'),
-                        timestamp=int(datetime.now().timestamp()),
-                        error=str(e)
-                    )
-                    # Publish the failure result to the Kafka failure topic
-                    producer.send(kafka_service.FAILURE_TOPIC, value=failure_message.model_dump_json().encode('utf-8'))
-
-            await asyncio.sleep(1) # Sleep to prevent busy-looping
+                records = [msg for partition_records in batch.values() for msg in partition_records]
+                if records:
+                    await process_batch(records, producer)
         
         except Exception as e:
             logger.error("Fatal Kafka consumer error", error=str(e))
-            await asyncio.sleep(5)  # Wait before retrying to reconnect
+            # Wait before retrying to reconnect, unless shutdown was requested
+            try:
+                await asyncio.wait_for(stop_requested.wait(), timeout=5)
+            except asyncio.TimeoutError:
+                pass
 
 # --- FastAPI Endpoints ---
 @app.on_event("startup")
 async def startup_event():
     """
     Event handler for application startup.
-    Starts the Kafka message processor as a background task.
+    Starts the scoring process pool and the Kafka message processor as a background task.
     """
-    asyncio.create_task(kafka_processor())
+    global processor_task, stop_requested
+    start_scoring_pools()
+    stop_requested = asyncio.Event()
+    processor_task = asyncio.create_task(kafka_processor())
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """
     Event handler for application shutdown.
-    Shuts down the Kafka consumer gracefully.
+    Lets the Kafka message processor finish its in-flight batch, then shuts
+    down the Kafka consumer and producer and the scoring pool gracefully.
     """
+    if processor_task:
+        stop_requested.set()
+        try:
+            await asyncio.wait_for(processor_task, timeout=settings.SHUTDOWN_TIMEOUT_S)
+        except asyncio.TimeoutError:
+            # wait_for has cancelled the processor; its batch is not published
+            logger.error("Kafka message processor did not stop in time")
     await kafka_service.stop_consumer()
+    await kafka_service.stop_producer()
+    stop_scoring_pools()
     logger.info("Application shutdown completed.")
 
 @app.get("/")
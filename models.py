@@ -1,43 +1,33 @@
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Any
 
-from pydantic import BaseModel, Field, condecimal
+from pydantic import BaseModel, ConfigDict, Field
 
-# Defines the structure of a single transaction
-class Transaction(BaseModel):
-    document_id: str
-    action: str
-    timestamp: int
-    caller: str
-    protocol: str
-    poolId: Optional[str] = None
-    poolName: Optional[str] = None
-    tokenIn: Optional[Dict[str, Any]] = None
-    tokenOut: Optional[Dict[str, Any]] = None
-    token_address: Optional[str] = None
-    amount: Optional[condecimal(max_digits=38, decimal_places=18)] = None
-    block_number: Optional[int] = None
-
-# Defines the structure for a protocol's data (e.g., 'dexes')
-class ProtocolData(BaseModel):
+# Defines the envelope of a protocol's data; transactions are left as raw
+# dictionaries instead of being validated row by row
+class ProtocolDataEnvelope(BaseModel):
     protocolType: str
-    transactions: List[Transaction]
+    transactions: List[Any]
 
-# Defines the structure of the incoming Kafka message
-class WalletTransactionMessage(BaseModel):
+# Defines the envelope of the incoming Kafka message, validated on the hot path
+class WalletMessageEnvelope(BaseModel):
     wallet_address: str
-    data: List[ProtocolData]
+    data: List[ProtocolDataEnvelope]
 
 # Defines the structure of the AI score features
 class AIFeatures(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     active_days: int
     lp_score: float
     swap_score: float
     total_transaction_count: int
-    user_tags: List[str]
+    user_tags: List[str] = []
 
 # Defines the structure of a category score in the final output
 class CategoryScore(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     category: str
     score: float
     transaction_count: int
@@ -45,6 +35,8 @@ class CategoryScore(BaseModel):
 
 # Defines the structure of the final successful Kafka output message
 class WalletScoreSuccess(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     wallet_address: str
     zscore: str = Field(..., description="18 decimal places for blockchain compatibility")
     timestamp: int
@@ -52,6 +44,8 @@ class WalletScoreSuccess(BaseModel):
 
 # Defines the structure of the final failed Kafka output message
 class WalletScoreFailure(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     wallet_address: str
     timestamp: int
     error: str
@@ -29,11 +29,14 @@ def test_calculate_active_days(ai_model_instance):
 
 def test_process_dex_transactions_with_data(ai_model_instance):
     """Test that LP and Swap scores are calculated with valid data."""
-    lp_score, swap_score, user_tags = ai_model_instance._process_dex_transactions(SAMPLE_DF)
+    lp_score, swap_score, lp_active_days, active_days, user_tags = \
+        ai_model_instance._process_dex_transactions(SAMPLE_DF)
     
     # Check if scores are non-zero when data exists
     assert lp_score > 0
     assert swap_score > 0
+    assert lp_active_days == 4
+    assert active_days == 9
     
     # Check for correct user tags based on mock data
     assert "consistent_lp" in user_tags
@@ -46,7 +49,7 @@ def test_calculate_score_with_full_data(ai_model_instance):
         "data": [{"protocolType": "dexes", "transactions": SAMPLE_DF.to_dict('records')}]
     }
     
-    final_score, features = ai_model_instance.calculate_score(wallet_data)
+    final_score, features = ai_model_instance.calculate_score(wallet_data["wallet_address"], wallet_data["data"])
     
     assert final_score > 0
     assert features["lp_score"] > 0
@@ -60,7 +63,7 @@ def test_calculate_score_with_no_dex_data(ai_model_instance):
         "wallet_address": "0x456",
         "data": [{"protocolType": "lending", "transactions": []}]
     }
-    final_score, features = ai_model_instance.calculate_score(wallet_data)
+    final_score, features = ai_model_instance.calculate_score(wallet_data["wallet_address"], wallet_data["data"])
     assert final_score == 0.0
     assert features == {}
 
@@ -70,6 +73,87 @@ def test_calculate_score_with_empty_transactions(ai_model_instance):
         "wallet_address": "0x789",
         "data": [{"protocolType": "dexes", "transactions": []}]
     }
-    final_score, features = ai_model_instance.calculate_score(wallet_data)
+    final_score, features = ai_model_instance.calculate_score(wallet_data["wallet_address"], wallet_data["data"])
     assert final_score == 0.0
     assert "inactive" in features.get("user_tags", [])
+
+def test_normalize_score_buckets(ai_model_instance):
+    """Test that raw scores map onto their percentile bucket values."""
+    assert ai_model_instance._normalize_score(0, 'lp_score') == 150
+    assert ai_model_instance._normalize_score(75, 'lp_score') == 750
+    assert ai_model_instance._normalize_score(80, 'swap_score') == 800
+    assert ai_model_instance._normalize_score(250, 'swap_score') == 1000
+    assert ai_model_instance._normalize_score(-1, 'lp_score') == 0.0
+
+    scores = np.array([0.5, 99.0, -3.0])
+    assert list(ai_model_instance._normalize_score(scores, 'lp_score')) == [150, 1000, 0.0]
+
+def test_calculate_score_batch_matches_single(ai_model_instance):
+    """Test that batch scoring returns the same results as scoring wallets one by one."""
+    wallets = [
+        {"wallet_address": "0x123", "data": [{"protocolType": "dexes", "transactions": SAMPLE_DF.to_dict('records')}]},
+        {"wallet_address": "0x456", "data": [{"protocolType": "lending", "transactions": []}]},
+        {"wallet_address": "0x789", "data": [{"protocolType": "dexes", "transactions": []}]},
+        {"wallet_address": "0xabc", "data": [{"protocolType": "dexes", "transactions": SAMPLE_DF.iloc[:3].to_dict('records')}]},
+    ]
+    results = ai_model_instance.calculate_score_batch(wallets)
+    assert results == [
+        ai_model_instance.calculate_score(wallet["wallet_address"], wallet["data"]) for wallet in wallets
+    ]
+
+def test_calculate_score_raw_memoizes_long_histories(ai_model_instance):
+    """Test that repeated long histories are served from the memo without sharing state."""
+    transactions = SAMPLE_DF.to_dict('records') * 4
+    first = ai_model_instance.calculate_score_raw("0x123", transactions)
+    first[1]["user_tags"].append("mutated")
+
+    second = ai_model_instance.calculate_score_raw("0x123", transactions)
+    assert len(ai_model_instance._cache) == 1
+    assert second[0] == first[0]
+    assert "mutated" not in second[1]["user_tags"]
+
+def test_calculate_score_raw_memo_detects_changed_history(ai_model_instance):
+    """Test that a history with the same endpoints but different transactions is rescored."""
+    transactions = SAMPLE_DF.to_dict('records') * 4
+    first = ai_model_instance.calculate_score_raw("0x123", transactions)
+
+    replayed = [dict(tx) for tx in transactions]
+    for tx in replayed[1:-1]:
+        tx["action"] = "swap"
+    second = ai_model_instance.calculate_score_raw("0x123", replayed)
+    assert len(ai_model_instance._cache) == 2
+    assert second != first
+    assert second == AIModel().calculate_score_raw("0x123", replayed)
+
+def test_calculate_score_batch_uses_memo(ai_model_instance):
+    """Test that batch scoring serves memoized wallets and scores the rest."""
+    long_history = SAMPLE_DF.to_dict('records') * 4
+    wallets = [
+        {"wallet_address": "0x123", "data": [{"protocolType": "dexes", "transactions": long_history}]},
+        {"wallet_address": "0x456", "data": [{"protocolType": "dexes", "transactions": long_history[:40]}]},
+        {"wallet_address": "0xabc", "data": [{"protocolType": "dexes", "transactions": SAMPLE_DF.iloc[:3].to_dict('records')}]},
+    ]
+    expected = [AIModel().calculate_score(wallet["wallet_address"], wallet["data"]) for wallet in wallets]
+
+    ai_model_instance.calculate_score_raw("0x123", long_history)
+    assert ai_model_instance.calculate_score_batch(wallets) == expected
+    assert len(ai_model_instance._cache) == 2
+
+@pytest.mark.parametrize("transaction, message", [
+    ({"timestamp": 1672531200}, "Transaction 1 is missing field 'action'"),
+    ({"action": "swap", "timestamp": "abc"}, "Transaction 1 has an invalid 'timestamp'"),
+    ({"action": "swap", "timestamp": None}, "Transaction 1 has an invalid 'timestamp'"),
+    ("swap", "Transaction 1 is not an object"),
+])
+def test_calculate_score_raw_names_invalid_transaction(ai_model_instance, transaction, message):
+    """Test that malformed transactions are reported with their index and field."""
+    transactions = [{"action": "swap", "timestamp": 1672531200}, transaction]
+    with pytest.raises(ValueError, match=message):
+        ai_model_instance.calculate_score_raw("0x123", transactions)
+
+def test_calculate_score_raw_drops_fractional_seconds(ai_model_instance):
+    """Test that float timestamps are truncated to whole seconds, not rejected."""
+    transactions = SAMPLE_DF.to_dict('records')
+    as_floats = [{**tx, "timestamp": tx["timestamp"] + 0.5} for tx in transactions]
+    assert ai_model_instance.calculate_score_raw("0x123", as_floats) == \
+        AIModel().calculate_score_raw("0x123", transactions)
@@ -0,0 +1,107 @@
+# test_main.py
+import asyncio
+import os
+from collections import namedtuple
+
+import orjson
+import pytest
+import structlog
+from concurrent.futures.process import BrokenProcessPool
+
+from app import main
+
+# Minimal stand-in for aiokafka's ConsumerRecord
+Record = namedtuple('Record', ['topic', 'partition', 'offset', 'timestamp', 'key', 'value'])
+
+def wallet_message(wallet_address, transactions, protocol_type='dexes'):
+    return {"wallet_address": wallet_address, "data": [{"protocolType": protocol_type, "transactions": transactions}]}
+
+TRANSACTIONS = [
+    {"document_id": str(day), "action": "swap", "timestamp": 1672531200 + day * 86400,
+     "caller": "0x123", "protocol": "uniswap_v3"}
+    for day in range(5)
+]
+GOOD = orjson.dumps(wallet_message("0x123", TRANSACTIONS))
+
+class FakeProducer:
+    """Collects sent payloads in place of an AIOKafkaProducer."""
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, topic, value):
+        self.sent.append((topic, value))
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(None)
+        return future
+
+    async def flush(self):
+        pass
+
+def record(value, partition=0):
+    return Record("wallet-transactions", partition, 0, 1700000000000, None, value)
+
+@pytest.fixture
+def scoring_workers(monkeypatch):
+    """Starts two scoring worker pools for the duration of a test."""
+    monkeypatch.setattr(main.settings, "SCORING_WORKERS", 2)
+    main.start_scoring_pools()
+    yield main.scoring_pools
+    main.stop_scoring_pools()
+
+def test_score_messages_isolates_failures():
+    """Test that each malformed message fails on its own without affecting the rest."""
+    messages = [
+        GOOD,
+        b'null',
+        b'[]',
+        b'123',
+        b'{not json',
+        orjson.dumps(wallet_message("0x456", [{"timestamp": 1672531200}])),
+        orjson.dumps(wallet_message("0x789", [{"action": "swap", "timestamp": "abc"}])),
+        orjson.dumps(wallet_message("0xabc", TRANSACTIONS, protocol_type='lending')),
+    ]
+    outputs = main.score_messages(messages, 1700000000)
+
+    succeeded, payload = outputs[0]
+    assert succeeded and payload["wallet_address"] == "0x123"
+    assert payload["categories"][0]["transaction_count"] == len(TRANSACTIONS)
+    for succeeded, payload in outputs[1:5]:
+        assert not succeeded and payload["wallet_address"] == "N/A"
+    assert outputs[5] == (False, {"wallet_address": "0x456", "timestamp": 1700000000,
+                                  "error": "Transaction 0 is missing field 'action'"})
+    assert not outputs[6][0] and "invalid 'timestamp'" in outputs[6][1]["error"]
+    assert outputs[7][1]["error"] == "No DEX data found for wallet"
+
+def test_process_batch_in_process(monkeypatch):
+    """Test that a batch is scored without worker pools when SCORING_WORKERS is 1."""
+    monkeypatch.setattr(main.settings, "SCORING_WORKERS", 1)
+    main.start_scoring_pools()
+    assert main.scoring_pools == []
+
+    producer = FakeProducer()
+    with structlog.testing.capture_logs():
+        asyncio.run(main.process_batch([record(GOOD), record(b'null')], producer))
+    assert [topic for topic, _ in producer.sent] == [main.kafka_service.SUCCESS_TOPIC, main.kafka_service.FAILURE_TOPIC]
+
+def test_process_batch_replaces_broken_worker(scoring_workers):
+    """Test that a crashed worker fails only its own records and is replaced."""
+    with pytest.raises(BrokenProcessPool):
+        scoring_workers[0].submit(os._exit, 1).result()
+    broken, healthy = scoring_workers[0], scoring_workers[1]
+
+    records = [record(GOOD, partition=0), record(orjson.dumps(wallet_message("0x456", TRANSACTIONS)), partition=1)]
+    producer = FakeProducer()
+    with structlog.testing.capture_logs() as logs:
+        asyncio.run(main.process_batch(records, producer))
+
+    assert [(topic, payload["wallet_address"]) for topic, payload in producer.sent] == [
+        (main.kafka_service.FAILURE_TOPIC, "0x123"),
+        (main.kafka_service.SUCCESS_TOPIC, "0x456"),
+    ]
+    assert any(log["event"] == "Scoring chunk failed" for log in logs)
+    assert main.scoring_pools[0] is not broken and main.scoring_pools[1] is healthy
+
+    producer = FakeProducer()
+    with structlog.testing.capture_logs():
+        asyncio.run(main.process_batch(records, producer))
+    assert [topic for topic, _ in producer.sent] == [main.kafka_service.SUCCESS_TOPIC] * 2